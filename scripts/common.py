@@ -16,16 +16,21 @@
 """Misc utilities and variables for Python scripts."""
 
 import contextlib
+import errno
+import glob
 import os
 import random
 import re
 import shlex
+import shutil
 import signal
 import subprocess
 import sys
+import tempfile
 import time
 
-__all__ = ['sh', 'captureSh', 'Sandbox', 'getDumpstr']
+__all__ = ['sh', 'captureSh', 'readOptionalFile', 'resetDir', 'Sandbox',
+           'getDumpstr']
 
 def sh(command, bg=False, **kwargs):
     """Execute a local command."""
@@ -50,6 +55,25 @@ def captureSh(command, **kwargs):
     else:
         return output
 
+def readOptionalFile(path):
+    """Return the contents of a file, or '' if it doesn't exist."""
+
+    try:
+        with open(path) as f:
+            return f.read()
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return ''
+
+def resetDir(path):
+    """Remove the files in a directory, creating it if it doesn't exist."""
+
+    for entry in glob.glob(os.path.join(path, '*')):
+        os.unlink(entry)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
 class Sandbox(object):
     """A context manager for launching and cleaning up remote processes."""
     class Process(object):
@@ -66,6 +90,27 @@ class Sandbox(object):
 
     def __init__(self):
         self.processes = []
+        self.hosts = set()
+        # Private (mode 0700) directory for this Sandbox's ssh control
+        # sockets, so that other users can't plant a socket there and other
+        # runs can't tear down connections this Sandbox is using
+        self.controlDir = tempfile.mkdtemp(prefix='logcabin-ssh-')
+
+    def sshOptions(self):
+        """Return the options passed to every ssh invocation.
+
+        The first connection to a host becomes a master that later
+        connections to the same host are multiplexed over, so only that first
+        command pays for the TCP and SSH handshakes.
+        """
+        return ['-o', 'ControlMaster=auto',
+                '-o', 'ControlPath=%s/%%r@%%h:%%p' % self.controlDir,
+                '-o', 'ControlPersist=60',
+                '-o', 'ConnectTimeout=10']
+
+    def sshCommand(self, host, *args):
+        """Return the argument list to run a command on a remote host."""
+        return ['ssh'] + self.sshOptions() + [host] + list(args)
 
     def rsh(self, host, command, ignoreFailures=False, bg=False, **kwargs):
         """Execute a remote command.
@@ -77,10 +122,11 @@ class Sandbox(object):
             sonce = ''.join([chr(random.choice(range(ord('a'), ord('z'))))
                              for c in range(8)])
             # Assumes scripts are at same path on remote machine
-            sh_command = ['ssh', host,
-                          '%s/regexec' % scripts_path, sonce,
-                          os.getcwd(), "'%s'" % command]
+            sh_command = self.sshCommand(host,
+                                         '%s/regexec' % scripts_path, sonce,
+                                         os.getcwd(), "'%s'" % command)
             p = subprocess.Popen(sh_command, **kwargs)
+            self.hosts.add(host)
             process = self.Process(host, command, kwargs, sonce,
                                    p, ignoreFailures)
             self.processes.append(process)
@@ -97,9 +143,9 @@ class Sandbox(object):
         @param process: A Process corresponding to the command to kill which
                         was created with rsh().
         """
-        killer = subprocess.Popen(['ssh', process.host,
-                                   '%s/killpid' % scripts_path,
-                                    process.sonce])
+        killer = subprocess.Popen(self.sshCommand(process.host,
+                                                  '%s/killpid' % scripts_path,
+                                                  process.sonce))
         killer.wait()
         try:
             process.proc.kill()
@@ -117,12 +163,17 @@ class Sandbox(object):
 
     def __exit__(self, exc_type, exc_value, exc_tb):
         with delayedInterrupts():
-            killers = []
+            # Kill all of a host's processes with a single ssh invocation
+            sonces = {}
             for p in self.processes:
+                sonces.setdefault(p.host, []).append(p.sonce)
+            killers = []
+            for host, host_sonces in sonces.items():
                 # Assumes scripts are at same path on remote machine
-                killers.append(subprocess.Popen(['ssh', p.host,
-                                                 '%s/killpid' % scripts_path,
-                                                 p.sonce]))
+                command = ' '.join(['%s/killpid %s &' % (scripts_path, sonce)
+                                    for sonce in host_sonces] + ['wait'])
+                killers.append(subprocess.Popen(
+                    self.sshCommand(host, command)))
             for killer in killers:
                 killer.wait()
         # a half-assed attempt to clean up zombies
@@ -132,6 +183,16 @@ class Sandbox(object):
             except:
                 pass
             p.proc.wait()
+        # shut down this Sandbox's multiplexed ssh connections rather than
+        # leaving them to linger until ControlPersist expires
+        with open(os.devnull, 'w') as devnull:
+            closers = [subprocess.Popen(['ssh'] + self.sshOptions() +
+                                        ['-O', 'exit', host],
+                                        stdout=devnull, stderr=devnull)
+                       for host in self.hosts]
+            for closer in closers:
+                closer.wait()
+        shutil.rmtree(self.controlDir, ignore_errors=True)
 
     def checkFailures(self):
         """Raise exception if any process has exited with a non-zero status."""
@@ -19,7 +19,7 @@ long each leader election takes.
 """
 
 from __future__ import print_function
-from common import sh, captureSh, Sandbox, hosts
+from common import captureSh, resetDir, Sandbox, hosts
 import re
 import subprocess
 import sys
@@ -27,6 +27,12 @@ import time
 
 num_servers = 5
 
+# Patterns for the log lines that reveal a server's view of the cluster,
+# compiled once since they're matched against every line on every poll.
+hail_leader_re = re.compile(r'All hail leader (\d+) for term (\d+)')
+now_leader_re = re.compile(r'Now leader for term (\d+)')
+running_re = re.compile(r'Running for election in term (\d+)')
+
 def same(seq):
     for x in seq:
         if x != seq[0]:
@@ -41,20 +47,21 @@ def await_stable_leader(sandbox, server_ids, after_term=0):
                                          'term': None,
                                          'wake': None}
             b = server_beliefs[server_id]
-            for line in open('debug/%d' % server_id):
-                m = re.search('All hail leader (\d+) for term (\d+)', line)
-                if m is not None:
-                    b['leader'] = int(m.group(1))
-                    b['term'] = int(m.group(2))
-                    continue
-                m = re.search('Now leader for term (\d+)', line)
-                if m is not None:
-                    b['leader'] = server_id
-                    b['term'] = int(m.group(1))
-                    continue
-                m = re.search('Running for election in term (\d+)', line)
-                if m is not None:
-                    b['wake'] = int(m.group(1))
+            with open('debug/%d' % server_id) as log:
+                for line in log:
+                    m = hail_leader_re.search(line)
+                    if m is not None:
+                        b['leader'] = int(m.group(1))
+                        b['term'] = int(m.group(2))
+                        continue
+                    m = now_leader_re.search(line)
+                    if m is not None:
+                        b['leader'] = server_id
+                        b['term'] = int(m.group(1))
+                        continue
+                    m = running_re.search(line)
+                    if m is not None:
+                        b['wake'] = int(m.group(1))
         terms = [b['term'] for b in server_beliefs.values()]
         leaders = [b['leader'] for b in server_beliefs.values()]
         if same(terms) and terms[0] > after_term:
@@ -67,8 +74,7 @@ def await_stable_leader(sandbox, server_ids, after_term=0):
             sandbox.checkFailures()
 
 with Sandbox() as sandbox:
-    sh('rm -f debug/*')
-    sh('mkdir -p debug')
+    resetDir('debug')
 
     server_ids = range(1, num_servers + 1)
     servers = {}
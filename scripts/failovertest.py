@@ -40,13 +40,23 @@ Options:
 """
 
 from __future__ import print_function, division
-from common import sh, captureSh, Sandbox, smokehosts
+from common import (sh, captureSh, readOptionalFile, resetDir, Sandbox,
+                    smokehosts)
 from docopt import docopt
 import os
 import random
+import shutil
 import subprocess
 import time
 
+# Configuration file contents for each server, filled in with the shared
+# options from smoketest.conf (if any) and the server's own settings.
+conf_template = ('%(extra)s'
+                 '\n'
+                 '\n'
+                 'serverId = %(server_id)d\n'
+                 'listenAddresses = %(address)s\n')
+
 def main():
     arguments = docopt(__doc__)
     client_commands = arguments['--client']
@@ -60,23 +70,19 @@ def main():
     launchdelay = int(arguments['--launchdelay'])
 
     server_ids = range(1, num_servers + 1)
-    cluster = "--cluster=%s" % ','.join([h[0] for h in
-                                        smokehosts[:num_servers]])
+    addresses = [h[0] for h in smokehosts[:num_servers]]
+    cluster = "--cluster=%s" % ','.join(addresses)
     with Sandbox() as sandbox:
-        sh('rm -rf smoketeststorage/')
-        sh('rm -f debug/*')
-        sh('mkdir -p debug')
+        shutil.rmtree('smoketeststorage', ignore_errors=True)
+        resetDir('debug')
 
+        extra_conf = readOptionalFile('smoketest.conf')
         for server_id in server_ids:
             host = smokehosts[server_id - 1]
             with open('smoketest-%d.conf' % server_id, 'w') as f:
-                try:
-                    f.write(open('smoketest.conf').read())
-                    f.write('\n\n')
-                except:
-                    pass
-                f.write('serverId = %d\n' % server_id)
-                f.write('listenAddresses = %s\n' % host[0])
+                f.write(conf_template % {'extra': extra_conf,
+                                         'server_id': server_id,
+                                         'address': host[0]})
 
 
         print('Initializing first server\'s log')
@@ -102,9 +108,7 @@ def main():
 
         print('Growing cluster')
         sh('build/Examples/Reconfigure %s %s set %s' %
-           (cluster,
-            reconf_opts,
-            ' '.join([h[0] for h in smokehosts[:num_servers]])))
+           (cluster, reconf_opts, ' '.join(addresses)))
 
         for i, client_command in enumerate(client_commands):
             print('Starting %s %s on localhost' % (client_command, cluster))
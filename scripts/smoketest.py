@@ -34,13 +34,25 @@ Options:
 """
 
 from __future__ import print_function, division
-from common import sh, captureSh, Sandbox, smokehosts
+from common import (sh, captureSh, readOptionalFile, resetDir, Sandbox,
+                    smokehosts)
 from docopt import docopt
 import os
 import random
+import shutil
+import string
 import subprocess
 import time
 
+# Configuration file contents for each server, filled in with the server's
+# own settings followed by the shared options from smoketest.conf (if any).
+conf_template = ('serverId = %(server_id)d\n'
+                 'listenAddresses = %(address)s\n'
+                 'clusterUUID = %(cluster_uuid)s\n'
+                 'snapshotMinLogSize = 1024\n'
+                 '\n'
+                 '%(extra)s')
+
 def main():
     arguments = docopt(__doc__)
     client_command = arguments['--client']
@@ -52,27 +64,22 @@ def main():
     timeout = int(arguments['--timeout'])
 
     server_ids = range(1, num_servers + 1)
-    cluster = "--cluster=%s" % ','.join([h[0] for h in
-                                        smokehosts[:num_servers]])
-    alphabet = [chr(ord('a') + i) for i in range(26)]
-    cluster_uuid = ''.join([random.choice(alphabet) for i in range(8)])
+    addresses = [h[0] for h in smokehosts[:num_servers]]
+    cluster = "--cluster=%s" % ','.join(addresses)
+    cluster_uuid = ''.join(random.choice(string.ascii_lowercase)
+                           for i in range(8))
     with Sandbox() as sandbox:
-        sh('rm -rf smoketeststorage/')
-        sh('rm -f debug/*')
-        sh('mkdir -p debug')
+        shutil.rmtree('smoketeststorage', ignore_errors=True)
+        resetDir('debug')
 
+        extra_conf = readOptionalFile('smoketest.conf')
         for server_id in server_ids:
             host = smokehosts[server_id - 1]
             with open('smoketest-%d.conf' % server_id, 'w') as f:
-                f.write('serverId = %d\n' % server_id)
-                f.write('listenAddresses = %s\n' % host[0])
-                f.write('clusterUUID = %s\n' % cluster_uuid)
-                f.write('snapshotMinLogSize = 1024')
-                f.write('\n\n')
-                try:
-                    f.write(open('smoketest.conf').read())
-                except:
-                    pass
+                f.write(conf_template % {'server_id': server_id,
+                                         'address': host[0],
+                                         'cluster_uuid': cluster_uuid,
+                                         'extra': extra_conf})
 
 
         print('Initializing first server\'s log')
@@ -93,9 +100,7 @@ def main():
 
         print('Growing cluster')
         sh('build/Examples/Reconfigure %s %s set %s' %
-           (cluster,
-            reconf_opts,
-            ' '.join([h[0] for h in smokehosts[:num_servers]])))
+           (cluster, reconf_opts, ' '.join(addresses)))
 
         print('Starting %s %s on localhost' % (client_command, cluster))
         client = sandbox.rsh('localhost',
@@ -103,12 +108,19 @@ def main():
                              bg=True,
                              stderr=open('debug/client', 'w'))
 
-        start = time.time()
-        while client.proc.returncode is None:
+        # time.monotonic() isn't thrown off by clock adjustments, but it only
+        # exists in Python 3.3 and up
+        clock = getattr(time, 'monotonic', time.time)
+        deadline = clock() + timeout
+        while True:
             sandbox.checkFailures()
-            time.sleep(.1)
-            if time.time() - start > timeout:
+            if client.proc.poll() is not None:
+                # the client may have exited since the check above
+                sandbox.checkFailures()
+                break
+            if clock() > deadline:
                 raise Exception('timeout exceeded')
+            time.sleep(.1)
 
 if __name__ == '__main__':
     main()